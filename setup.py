@@ -10,7 +10,8 @@ setup(
     url="https://github.com/owais-rizvi/xplc",
     py_modules=["xplc"],
     install_requires=[
-        "requests>=2.25.0",
+        "httpx[http2]>=0.27",
+        "orjson>=3.9",
     ],
     entry_points={
         "console_scripts": [
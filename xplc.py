@@ -4,45 +4,131 @@ xplc (XplainCrash) - AI-powered CLI error explainer
 Usage: xplc <command>
 """
 
+import os
 import sys
-import subprocess
+import re
+import shlex
+import threading
+import queue
+import stat
 import json
-from pathlib import Path
-import argparse
-import requests
-from typing import Dict, Any, Optional, Tuple
-from colorama import Fore, Style, init
+import time
+import random
+import hashlib
+import asyncio
+import gzip
+import codecs
+import functools
+import copy
+from typing import IO, TYPE_CHECKING, Callable, Dict, Any, Iterator, List, Optional, Tuple
 
-init(autoreset=True)
+if TYPE_CHECKING:
+    import httpx
+
+# httpx and argparse are imported where they are used, so neither delays
+# starting the wrapped command
+
+# Raw ANSI colours, left empty when output is piped
+_TTY = sys.stdout.isatty()
+RED = "\x1b[31m" if _TTY else ""
+GREEN = "\x1b[32m" if _TTY else ""
+YELLOW = "\x1b[33m" if _TTY else ""
+CYAN = "\x1b[36m" if _TTY else ""
+RESET = "\x1b[0m" if _TTY else ""
+
+# stderr may be redirected independently of stdout
+_ERR_TTY = sys.stderr.isatty()
+ERR_YELLOW = "\x1b[33m" if _ERR_TTY else ""
+ERR_RESET = "\x1b[0m" if _ERR_TTY else ""
+
+if sys.platform == 'win32' and (_TTY or _ERR_TTY):
+    # Enable virtual terminal processing so the console interprets ANSI codes
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    for handle, is_tty in ((-11, _TTY), (-12, _ERR_TTY)):
+        if is_tty:
+            kernel32.SetConsoleMode(kernel32.GetStdHandle(handle), 7)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact JSON encoding, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys, ensure_ascii=False).encode()
+
+def _json_loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+XPLC_HOME = os.environ.get('XPLC_HOME') or os.path.expanduser(os.path.join('~', '.xplc'))
+CONFIG_PATH = os.path.join(XPLC_HOME, 'config.json')
+CACHE_DIR = os.path.join(XPLC_HOME, 'cache')
 
 class Config:
     """Handle configuration and API keys"""
     
+    # Config files shared across instances as (mtime, raw bytes, parsed dict),
+    # keyed by path and invalidated whenever the file's mtime changes
+    _cache: Dict[str, Tuple[float, bytes, Dict[str, Any]]] = {}
+    
     def __init__(self):
-        self.config_dir = Path.home() / '.xplc'
-        self.config_file = self.config_dir / 'config.json'
-        self.config_dir.mkdir(exist_ok=True)
+        # Directories are only created when something is first written
+        self.config_dir = XPLC_HOME
+        self.config_file = CONFIG_PATH
+        self.cache_dir = CACHE_DIR
+        # Raw bytes last read or written, so save_config can skip no-op writes
+        self._last_saved: Optional[bytes] = None
         self._config = self._load_config()
     
+    def _serialize(self) -> bytes:
+        # Compact encoding: the file is machine-read, so skip the indentation
+        return _json_dumps(self._config)
+    
     def _load_config(self) -> Dict[str, Any]:
-        if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError):
-                return {}
-        return {}
+        try:
+            mtime = os.stat(self.config_file).st_mtime
+        except OSError:
+            return {}
+        
+        cached = Config._cache.get(self.config_file)
+        if cached and cached[0] == mtime:
+            self._last_saved = cached[1]
+            # A copy, so unsaved changes never leak into the shared cache
+            return copy.deepcopy(cached[2])
+        
+        try:
+            with open(self.config_file, 'rb') as f:
+                data = f.read()
+            config = _json_loads(data)
+        except (ValueError, IOError):
+            return {}
+        Config._cache[self.config_file] = (mtime, data, copy.deepcopy(config))
+        self._last_saved = data
+        return config
     
     def save_config(self):
-        with open(self.config_file, 'w') as f:
-            json.dump(self._config, f, indent=2)
+        data = self._serialize()
+        if data == self._last_saved:
+            return
+        os.makedirs(self.config_dir, exist_ok=True)
+        with open(self.config_file, 'wb') as f:
+            f.write(data)
+        self._last_saved = data
+        Config._cache[self.config_file] = (
+            os.stat(self.config_file).st_mtime, data, copy.deepcopy(self._config)
+        )
     
     def set_api_key(self, provider: str, key: str):
         if 'api_keys' not in self._config:
             self._config['api_keys'] = {}
         self._config['api_keys'][provider] = key
         self.save_config()
-        print(Fore.GREEN + f"✓ {provider} API key saved")
+        print(f"{GREEN}✓ {provider} API key saved{RESET}")
     
     def get_api_key(self, provider: str) -> Optional[str]:
         return self._config.get('api_keys', {}).get(provider)
@@ -50,219 +136,716 @@ class Config:
     def set_default_provider(self, provider: str):
         self._config['default_provider'] = provider
         self.save_config()
-        print(Fore.GREEN + f"✓ Default provider set to {provider}")
+        print(f"{GREEN}✓ Default provider set to {provider}{RESET}")
     
     def get_default_provider(self) -> str:
         return self._config.get('default_provider', 'openai')
 
+PROMPT_TEMPLATE = """Explain this command error briefly and suggest a fix:
+
+Command: {command}
+Error: {stderr}
+Exit code: {exit_code}
+
+Respond in this exact format:
+- Error: [brief error description]
+- Fix: [concise fix suggestion]
+- [one-line explanation]"""
+PROMPT_STDERR_CHARS = 4000  # long stack traces only waste input tokens
+MAX_TOKENS = 150  # response budget per explanation
+
+def _build_prompt(error_context: Dict[str, Any]) -> str:
+    """Shared prompt for all providers"""
+    return PROMPT_TEMPLATE.format_map(error_context)
+
+BATCH_PROMPT_TEMPLATE = """Explain each of these {count} command errors briefly and suggest a fix.
+
+{errors}
+
+Respond with a numbered list of exactly {count} items, one per error and in the
+same order, each in this exact format:
+1. - Error: [brief error description]
+   - Fix: [concise fix suggestion]
+   - [one-line explanation]"""
+BATCH_ERROR_TEMPLATE = """Error {number}:
+Command: {command}
+Error: {stderr}
+Exit code: {exit_code}"""
+BATCH_ITEM_PATTERN = re.compile(r'^(\d+)\.\s', re.MULTILINE)
+
+def _build_batch_prompt(error_contexts: List[Dict[str, Any]]) -> str:
+    errors = "\n\n".join(
+        BATCH_ERROR_TEMPLATE.format_map({**context, 'number': number})
+        for number, context in enumerate(error_contexts, 1)
+    )
+    return BATCH_PROMPT_TEMPLATE.format(count=len(error_contexts), errors=errors)
+
+def _split_batch_response(text: str, count: int) -> List[str]:
+    """Split a numbered-list response back into one explanation per error"""
+    # Only unindented items numbered in sequence start a new explanation, so
+    # numbered steps inside an answer stay part of it
+    starts = []
+    for match in BATCH_ITEM_PATTERN.finditer(text):
+        if len(starts) < count and int(match.group(1)) == len(starts) + 1:
+            starts.append(match)
+    
+    explanations = []
+    for i, match in enumerate(starts):
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        body = text[match.end():end]
+        explanations.append("\n".join(line.strip() for line in body.strip().splitlines()))
+    explanations += [f"{EXPLANATION_FAILED}: missing from batch response"] * (count - len(explanations))
+    return explanations
+
+def _summarize_stderr(head: str, tail: str = "", omitted: int = 0,
+                      max_chars: int = PROMPT_STDERR_CHARS) -> str:
+    """Shorten long stderr to its first few lines and its end, where the actionable error usually is
+    
+    Pass the whole of stderr as head, or its start and end as head and tail
+    along with the number of bytes omitted between them.
+    """
+    if not omitted and len(head) + len(tail) <= max_chars:
+        return head + tail
+    
+    lines = head.splitlines()
+    head_text = "\n".join(lines[:5])[:max_chars // 4]
+    tail_lines = tail.splitlines() if omitted else lines[5:]
+    tail_text = "\n".join(tail_lines[-40:])[-(max_chars - len(head_text)):]
+    truncated = (len(head.encode()) + omitted + len(tail.encode())
+                 - len(head_text.encode()) - len(tail_text.encode()))
+    return f"{head_text}\n...[{truncated} bytes truncated]...\n{tail_text}"
+
+def _summarize_captured_stderr(head: bytes, tail: bytes, size: int) -> str:
+    """Summarize stderr of which only the first and last bytes were kept"""
+    if len(head) + len(tail) == size:
+        return _summarize_stderr((head + tail).decode('utf-8', errors='replace'))
+    
+    # Cut both sides of the gap back to whole lines, or failing that whole
+    # characters, so no line or character is split where bytes were dropped
+    head_end = head.rfind(b'\n') + 1 or len(head)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    head_text = decoder.decode(head[:head_end])  # holds back a character cut off at the end
+    head_end -= len(decoder.getstate()[0])
+    tail_start = tail.find(b'\n') + 1
+    if not tail_start:
+        while tail_start < len(tail) and 0x80 <= tail[tail_start] < 0xC0:
+            tail_start += 1
+    return _summarize_stderr(
+        head_text,
+        tail[tail_start:].decode('utf-8', errors='replace'),
+        size - head_end - (len(tail) - tail_start)
+    )
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+EXPLANATION_FAILED = "Failed to get AI explanation"
+CACHE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
+GZIP_MIN_BYTES = 1024  # smaller bodies aren't worth compressing
+
 class AIProvider:
     """Base class for AI providers"""
     
-    def explain_error(self, error_context: Dict[str, Any]) -> str:
+    model = ""
+    
+    # Whether the endpoint accepts gzip Content-Encoding on request bodies
+    compress_requests = False
+    
+    def __init__(self, headers: Dict[str, str]):
+        # HTTP/2 clients are created on first use and kept for the provider's
+        # lifetime, so repeated calls multiplex over a single TLS connection
+        self.headers = {"Accept-Encoding": "gzip, deflate", **headers}
+        self.client = None
+        self.async_client = None
+        # Batch mode warms up on a thread while the main thread may already post
+        self._client_lock = threading.Lock()
+    
+    def _get_client(self) -> 'httpx.Client':
+        with self._client_lock:
+            if self.client is None:
+                import httpx
+                self.client = httpx.Client(
+                    http2=True,
+                    headers=self.headers,
+                    timeout=10.0,
+                    limits=httpx.Limits(max_keepalive_connections=4, max_connections=10)
+                )
+            return self.client
+    
+    def _build_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
         raise NotImplementedError
+    
+    def _retry_delay(self, error: Exception, attempt: int, base: float, cap: float) -> Optional[float]:
+        """Return seconds to wait before retrying, or None if the error is not retryable"""
+        import httpx
+        
+        if isinstance(error, httpx.HTTPStatusError):
+            response = error.response
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                return None
+            retry_after = response.headers.get('Retry-After')
+            if response.status_code == 429 and retry_after and retry_after.isdigit():
+                return min(cap, float(retry_after))
+        elif not isinstance(error, httpx.TransportError):
+            return None
+        
+        # Exponential backoff with jitter so clients don't retry in lockstep
+        return min(cap, base * 2 ** attempt) * (1 + random.uniform(0, 0.5))
+    
+    def _encode_body(self, data: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        """Encode a JSON request body, gzipping large ones where the provider accepts it"""
+        body = _json_dumps(data)
+        if self.compress_requests and len(body) > GZIP_MIN_BYTES:
+            # Level 1: higher levels cost far more CPU for little extra ratio on JSON
+            return gzip.compress(body, compresslevel=1), {"Content-Encoding": "gzip"}
+        return body, {}
+    
+    def _post_with_retry(self, url: str, data: Dict[str, Any], max_retries: int = 3,
+                         base: float = 1.0, cap: float = 30.0) -> 'httpx.Response':
+        """POST with retries on connection errors, timeouts, 429 and 5xx responses"""
+        import httpx
+        
+        body, headers = self._encode_body(data)
+        for attempt in range(max_retries):
+            try:
+                response = self._get_client().post(url, content=body, headers=headers)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(e, attempt, base, cap)
+                if delay is None or attempt == max_retries - 1:
+                    raise
+                time.sleep(delay)
+    
+    async def _post_with_retry_async(self, url: str, data: Dict[str, Any], max_retries: int = 3,
+                                     base: float = 1.0, cap: float = 30.0) -> 'httpx.Response':
+        import httpx
+        
+        body, headers = self._encode_body(data)
+        for attempt in range(max_retries):
+            try:
+                response = await self._get_async_client().post(url, content=body, headers=headers)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                delay = self._retry_delay(e, attempt, base, cap)
+                if delay is None or attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+    
+    def _parse_response(self, body: Dict[str, Any]) -> str:
+        raise NotImplementedError
+    
+    def warm_up(self):
+        """Open the connection ahead of the first request so it skips DNS, TCP and TLS setup"""
+        import httpx
+        
+        try:
+            self._get_client().head(httpx.URL(self.base_url).join('/'), timeout=2.0)
+        except httpx.HTTPError:
+            pass
+    
+    def explain_error(self, error_context: Dict[str, Any]) -> str:
+        data = self._build_request(_build_prompt(error_context), MAX_TOKENS)
+        
+        try:
+            response = self._post_with_retry(self.base_url, data)
+            return self._parse_response(_json_loads(response.content))
+        except Exception as e:
+            return f"{EXPLANATION_FAILED}: {str(e)}"
+    
+    def _get_async_client(self) -> 'httpx.AsyncClient':
+        if self.async_client is None:
+            import httpx
+            self.async_client = httpx.AsyncClient(
+                http2=True,
+                headers=self.headers,
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=4, max_connections=10)
+            )
+        return self.async_client
+    
+    async def aclose(self):
+        """Close the async client, which is bound to the event loop that used it"""
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+    
+    async def warm_up_async(self):
+        import httpx
+        
+        try:
+            await self._get_async_client().head(httpx.URL(self.base_url).join('/'), timeout=2.0)
+        except httpx.HTTPError:
+            pass
+    
+    async def explain_error_async(self, error_context: Dict[str, Any]) -> str:
+        """Async variant so several explanations can share one HTTP/2 connection"""
+        data = self._build_request(_build_prompt(error_context), MAX_TOKENS)
+        
+        try:
+            response = await self._post_with_retry_async(self.base_url, data)
+            return self._parse_response(_json_loads(response.content))
+        except Exception as e:
+            return f"{EXPLANATION_FAILED}: {str(e)}"
+    
+    def explain_errors_batch(self, error_contexts: List[Dict[str, Any]]) -> List[str]:
+        """Explain several errors with a single request, one explanation per error"""
+        data = self._build_request(_build_batch_prompt(error_contexts), MAX_TOKENS * len(error_contexts))
+        
+        try:
+            response = self._post_with_retry(self.base_url, data)
+            text = self._parse_response(_json_loads(response.content))
+        except Exception as e:
+            return [f"{EXPLANATION_FAILED}: {str(e)}"] * len(error_contexts)
+        return _split_batch_response(text, len(error_contexts))
 
 class OpenAIProvider(AIProvider):
+    model = "gpt-3.5-turbo"
+    compress_requests = True
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.openai.com/v1/chat/completions"
-    
-    def explain_error(self, error_context: Dict[str, Any]) -> str:
-        prompt = self._build_prompt(error_context)
-        
-        headers = {
+        super().__init__({
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "gpt-3.5-turbo",
+        })
+    
+    def _build_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        return {
+            "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 150,
+            "max_tokens": max_tokens,
             "temperature": 0.3
         }
-        
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"].strip()
-        except Exception as e:
-            return f"Failed to get AI explanation: {str(e)}"
     
-    def _build_prompt(self, context: Dict[str, Any]) -> str:
-        return f"""Explain this command error briefly and suggest a fix:
-
-Command: {context['command']}
-Error: {context['stderr']}
-Exit code: {context['exit_code']}
-
-
-Respond in this exact format:
-- Error: [brief error description]
-- Fix: [concise fix suggestion]
-- [one-line explanation]"""
+    def _parse_response(self, body: Dict[str, Any]) -> str:
+        return body["choices"][0]["message"]["content"].strip()
 
 class ClaudeProvider(AIProvider):
+    model = "claude-3-haiku-20240307"
+    compress_requests = True
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.anthropic.com/v1/messages"
-    
-    def explain_error(self, error_context: Dict[str, Any]) -> str:
-        prompt = self._build_prompt(error_context)
-        
-        headers = {
+        super().__init__({
             "x-api-key": self.api_key,
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01"
-        }
-        
-        data = {
-            "model": "claude-3-haiku-20240307",
-            "max_tokens": 150,
+        })
+    
+    def _build_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_tokens": max_tokens,
             "messages": [{"role": "user", "content": prompt}]
         }
-        
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
-            return response.json()["content"][0]["text"].strip()
-        except Exception as e:
-            return f"Failed to get AI explanation: {str(e)}"
     
-    def _build_prompt(self, context: Dict[str, Any]) -> str:
-        return f"""Explain this command error briefly and suggest a fix:
-
-Command: {context['command']}
-Error: {context['stderr']}
-Exit code: {context['exit_code']}
-
-Respond in this exact format:
-- Error: [brief error description]
-- Fix: [concise fix suggestion]
-- [one-line explanation]"""
+    def _parse_response(self, body: Dict[str, Any]) -> str:
+        return body["content"][0]["text"].strip()
 
 class GeminiProvider(AIProvider):
+    model = "gemini-1.5-flash-latest"
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
+        self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent?key={api_key}"
+        super().__init__({"Content-Type": "application/json"})
     
-    def explain_error(self, error_context: Dict[str, Any]) -> str:
-        prompt = self._build_prompt(error_context)
-        
-        headers = {"Content-Type": "application/json"}
-        
-        data = {
+    def _build_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        return {
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {
-                "maxOutputTokens": 150,
+                "maxOutputTokens": max_tokens,
                 "temperature": 0.3
             }
         }
-        
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
-            return response.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
-        except Exception as e:
-            return f"Failed to get AI explanation: {str(e)}"
     
-    def _build_prompt(self, context: Dict[str, Any]) -> str:
-        return f"""Explain this command error briefly and suggest a fix:
+    def _parse_response(self, body: Dict[str, Any]) -> str:
+        return body["candidates"][0]["content"]["parts"][0]["text"].strip()
 
-Command: {context['command']}
-Error: {context['stderr']}
-Exit code: {context['exit_code']}
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'claude': ClaudeProvider,
+    'gemini': GeminiProvider
+}
 
-Respond in this exact format:
-- Error: [brief error description]
-- Fix: [concise fix suggestion]
-- [one-line explanation]"""
+@functools.lru_cache(maxsize=8)
+def _get_provider_instance(provider_name: str, api_key: str) -> AIProvider:
+    """Reuse provider instances, and with them their open connections"""
+    return PROVIDERS[provider_name](api_key)
+
+COMMAND_TIMEOUT = 30  # seconds
+STDERR_HEAD_BYTES = 1024  # enough for the first lines of stderr
+STDERR_TAIL_BYTES = 8192  # the explanation mostly needs the end of stderr
+SPECULATE_IDLE = 0.2  # seconds of quiet stderr before speculating
+WARM_UP_DELAY = 0.3  # seconds a command must run before the provider is warmed up
+SPECULATE_MIN_CHARS = 256
+BATCH_SIZE = 10  # errors per batched request
+ERROR_PATTERN = re.compile(r'Error\b|Traceback|error:|undefined|not found')
 
 class ErrorExplainer:
     """Main class that runs commands and explains errors"""
     
     def __init__(self):
         self.config = Config()
-        self.providers = {
-            'openai': OpenAIProvider,
-            'claude': ClaudeProvider,
-            'gemini': GeminiProvider
-        }
     
-    def run_command(self, command_args: list) -> Tuple[str, str, int]:
-        """Run command and capture output"""
+    async def run_command(self, command_args: list,
+                          on_stderr_idle: Optional[Callable[[str], None]] = None,
+                          on_long_running: Optional[Callable[[], None]] = None) -> Tuple[str, int]:
+        """Run command, streaming its output live, and return summarized stderr
+        
+        Only the start and end of stderr are kept, and the summary is built
+        from those. on_long_running is called once if the command is still
+        running WARM_UP_DELAY seconds after it was spawned. on_stderr_idle is
+        called with the summary so far whenever the command has written new
+        stderr and then gone quiet for SPECULATE_IDLE seconds.
+        """
         try:
-            result = subprocess.run(
-                command_args,
-                capture_output=True,
-                text=True,
-                timeout=30
+            proc = await asyncio.create_subprocess_exec(
+                *command_args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
             )
-            return result.stdout, result.stderr, result.returncode
-        except subprocess.TimeoutExpired:
-            return "", "Command timed out after 30 seconds", 1
         except Exception as e:
-            return "", f"Failed to run command: {str(e)}", 1
-    
+            message = f"Failed to run command: {str(e)}"
+            print(message, file=sys.stderr)
+            return message, 1
+        
+        loop = asyncio.get_running_loop()
+        stderr_head = bytearray()
+        stderr_tail = bytearray()
+        stderr_size = 0
+        idle_timer = None
+        long_running_timer = loop.call_later(WARM_UP_DELAY, on_long_running) if on_long_running else None
+        
+        def notify_idle():
+            on_stderr_idle(_summarize_captured_stderr(stderr_head, stderr_tail, stderr_size))
+        
+        async def drain(reader: asyncio.StreamReader, stream, capture: bool = False):
+            # Output is forwarded as raw bytes; only the kept stderr is ever decoded
+            nonlocal idle_timer, stderr_size
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    return
+                stream.write(chunk)
+                stream.flush()
+                if capture:
+                    stderr_size += len(chunk)
+                    room = STDERR_HEAD_BYTES - len(stderr_head)
+                    if room > 0:
+                        stderr_head.extend(chunk[:room])
+                        chunk = chunk[room:]
+                    stderr_tail.extend(chunk)
+                    del stderr_tail[:-STDERR_TAIL_BYTES]
+                    if on_stderr_idle:
+                        if idle_timer:
+                            idle_timer.cancel()
+                        idle_timer = loop.call_later(SPECULATE_IDLE, notify_idle)
+        
+        try:
+            _, _, exit_code = await asyncio.wait_for(
+                asyncio.gather(
+                    drain(proc.stdout, sys.stdout.buffer),
+                    drain(proc.stderr, sys.stderr.buffer, capture=True),
+                    proc.wait()
+                ),
+                COMMAND_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            message = f"Command timed out after {COMMAND_TIMEOUT} seconds"
+            print(message, file=sys.stderr)
+            return message, 1
+        finally:
+            if idle_timer:
+                idle_timer.cancel()
+            if long_running_timer:
+                long_running_timer.cancel()
+        
+        return _summarize_captured_stderr(stderr_head, stderr_tail, stderr_size), exit_code
     
     def get_provider(self, provider_name: str = None) -> Optional[AIProvider]:
         """Get AI provider instance"""
         if not provider_name:
             provider_name = self.config.get_default_provider()
         
+        if provider_name not in PROVIDERS:
+            print(f"{RED}Unknown provider: {provider_name}{RESET}")
+            print(f"{YELLOW}Available: {', '.join(PROVIDERS.keys())}{RESET}")
+            return None
+        
         api_key = self.config.get_api_key(provider_name)
         if not api_key:
-            print(Fore.RED + f"No API key found for {provider_name}")
-            print(Fore.YELLOW + f"Set it with: xplc config --set-key {provider_name} YOUR_API_KEY")
+            print(f"{RED}No API key found for {provider_name}{RESET}")
+            print(f"{YELLOW}Set it with: xplc config --set-key {provider_name} YOUR_API_KEY{RESET}")
             return None
         
-        if provider_name not in self.providers:
-            print(Fore.RED + f"Unknown provider: {provider_name}")
-            print(Fore.YELLOW + f"Available: {', '.join(self.providers.keys())}")
+        return _get_provider_instance(provider_name, api_key)
+    
+    def _cache_path(self, error_context: Dict[str, Any], provider_name: str, model: str) -> str:
+        key = hashlib.sha256(
+            _json_dumps(error_context, sort_keys=True) + f"{provider_name}:{model}".encode()
+        ).hexdigest()
+        return os.path.join(self.config.cache_dir, key)
+    
+    def _read_cache(self, cache_path: str) -> Optional[str]:
+        try:
+            if time.time() - os.stat(cache_path).st_mtime < CACHE_MAX_AGE:
+                with open(cache_path, encoding='utf-8') as f:
+                    return f.read()
+            # Expired entries are removed so the cache doesn't grow without bound
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return None
+    
+    def _write_cache(self, cache_path: str, explanation: str):
+        if explanation.startswith(EXPLANATION_FAILED):
+            return
+        try:
+            os.makedirs(self.config.cache_dir, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(explanation)
+        except OSError:
+            pass
+    
+    def get_explanation(self, provider: AIProvider, provider_name: str,
+                        error_context: Dict[str, Any]) -> Tuple[str, bool]:
+        """Return (explanation, cached), serving repeated errors from the on-disk cache"""
+        cache_path = self._cache_path(error_context, provider_name, provider.model)
+        explanation = self._read_cache(cache_path)
+        if explanation is not None:
+            return explanation, True
+        
+        explanation = provider.explain_error(error_context)
+        self._write_cache(cache_path, explanation)
+        return explanation, False
+    
+    async def get_explanation_async(self, provider: AIProvider, provider_name: str,
+                                    error_context: Dict[str, Any]) -> Tuple[str, bool]:
+        cache_path = self._cache_path(error_context, provider_name, provider.model)
+        explanation = self._read_cache(cache_path)
+        if explanation is not None:
+            return explanation, True
+        
+        explanation = await provider.explain_error_async(error_context)
+        self._write_cache(cache_path, explanation)
+        return explanation, False
+    
+    def explain_batch(self, provider: AIProvider, provider_name: str, entries: List[Dict[str, Any]]):
+        """Explain already-failed commands, sending every uncached one in a single request"""
+        error_contexts = [
+            {
+                'command': entry['command'],
+                'stderr': _summarize_stderr(entry.get('stderr', '')),
+                'exit_code': entry.get('exit_code', 1),
+            }
+            for entry in entries
+        ]
+        cache_paths = [self._cache_path(context, provider_name, provider.model) for context in error_contexts]
+        explanations = [self._read_cache(path) for path in cache_paths]
+        
+        missing = [i for i, explanation in enumerate(explanations) if explanation is None]
+        if missing:
+            fetched = provider.explain_errors_batch([error_contexts[i] for i in missing])
+            for i, explanation in zip(missing, fetched):
+                self._write_cache(cache_paths[i], explanation)
+                explanations[i] = explanation
+        
+        for i, (context, explanation) in enumerate(zip(error_contexts, explanations)):
+            suffix = "" if i in missing else " (cached)"
+            print(f"{CYAN}$ {context['command']}{suffix}{RESET}")
+            print(f"{GREEN}{explanation}{RESET}")
+            print()
+    
+    def _parse_batch_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse one {command, stderr, exit_code} JSON line, warning about bad input"""
+        if not line.strip():
+            return None
+        try:
+            entry = _json_loads(line)
+        except ValueError:
+            entry = None
+        if isinstance(entry, dict):
+            command = entry.get('command')
+            exit_code = entry.get('exit_code', 1)
+            valid = (
+                (isinstance(command, str)
+                 or isinstance(command, list) and all(isinstance(arg, str) for arg in command))
+                and isinstance(entry.get('stderr', ''), str)
+                and isinstance(exit_code, int) and not isinstance(exit_code, bool)
+            )
+        else:
+            valid = False
+        if not valid:
+            print(f"{ERR_YELLOW}Skipping invalid batch entry: {line.strip()}{ERR_RESET}", file=sys.stderr)
             return None
+        if isinstance(entry['command'], list):
+            entry['command'] = shlex.join(entry['command'])
+        return entry
+    
+    def _read_batches(self, stream: IO[str], window: float) -> Iterator[List[Dict[str, Any]]]:
+        """Yield entries from stream in batches of BATCH_SIZE, or sooner once the
+        first entry of a batch has waited window seconds"""
+        if stat.S_ISREG(os.fstat(stream.fileno()).st_mode):
+            # Nothing more will arrive later, so there is nothing to wait for
+            entries = [entry for entry in map(self._parse_batch_line, stream) if entry]
+            for start in range(0, len(entries), BATCH_SIZE):
+                yield entries[start:start + BATCH_SIZE]
+            return
+        
+        # Pipes and terminals are read on a thread so the window can be timed
+        # with a queue, which also works where select() can't wait on stdin
+        lines: queue.Queue = queue.Queue()
+        
+        def read_lines():
+            for line in iter(stream.readline, ''):
+                lines.put(line)
+            lines.put(None)
         
-        return self.providers[provider_name](api_key)
+        threading.Thread(target=read_lines, daemon=True).start()
+        
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                line = lines.get(timeout=timeout)
+            except queue.Empty:
+                yield batch
+                batch, deadline = [], None
+                continue
+            
+            if line is None:
+                if batch:
+                    yield batch
+                return
+            
+            entry = self._parse_batch_line(line)
+            if entry is None:
+                continue
+            if not batch:
+                deadline = time.monotonic() + window
+            batch.append(entry)
+            if len(batch) == BATCH_SIZE:
+                yield batch
+                batch, deadline = [], None
     
-    def explain(self, command_args: list, provider_name: str = None):
-        """Run command and explain any errors"""
+    def batch(self, from_file: Optional[str] = None, window_ms: int = 500, provider_name: str = None):
+        """Explain failures listed as JSON lines in a file, or streamed on stdin"""
+        provider_name = provider_name or self.config.get_default_provider()
+        provider = self.get_provider(provider_name)
+        if not provider:
+            return
+        threading.Thread(target=provider.warm_up, daemon=True).start()
+        
+        if from_file:
+            try:
+                f = open(from_file, encoding='utf-8')
+            except OSError as e:
+                print(f"{RED}Cannot read {from_file}: {e.strerror}{RESET}")
+                return
+            with f:
+                for entries in self._read_batches(f, window_ms / 1000):
+                    self.explain_batch(provider, provider_name, entries)
+        else:
+            for entries in self._read_batches(sys.stdin, window_ms / 1000):
+                self.explain_batch(provider, provider_name, entries)
+    
+    def _error_context(self, command_args: list, stderr: str, exit_code: int) -> Dict[str, Any]:
+        return {
+            'command': shlex.join(command_args),
+            'stderr': stderr,
+            'exit_code': exit_code,
+        }
+    
+    async def explain(self, command_args: list, provider_name: str = None):
+        """Run command and explain any errors
+        
+        The command, the connection warm-up and any speculative explanation
+        all share one event loop.
+        """
         if not command_args:
             print("No command provided")
             return
         
-        # Run the command
-        stdout, stderr, exit_code = self.run_command(command_args)
+        provider_name = provider_name or self.config.get_default_provider()
+        background = []
+        state = {}
         
-        # If successful, just show output
-        if exit_code == 0:
-            if stdout:
-                print(stdout)
-            if stderr:  # Some tools output warnings to stderr even on success
-                print(stderr)
-            return
+        async def warm_up():
+            # Built here, and only for commands that outlive WARM_UP_DELAY, so
+            # importing httpx and setting up TLS never delays the child process
+            # or slows down commands that finish quickly
+            state['provider'] = self.get_provider(provider_name)
+            if 'idle_stderr' in state:
+                # stderr went quiet before the provider existed
+                speculate(state.pop('idle_stderr'))
+            await state['provider'].warm_up_async()
         
-        # Command failed - show original error first
-        print("Original command output:")
-        if stdout:
-            print(stdout)
-        if stderr:
-            print(stderr, file=sys.stderr)
-        print()
-        
-        # Get AI explanation if error occurred
-        if stderr or exit_code != 0:
-            provider = self.get_provider(provider_name)
-            if not provider:
+        def start_warm_up():
+            background.append(asyncio.create_task(warm_up()))
+        
+        # Only warm up a usable provider, so a missing key or unknown provider
+        # is still reported after the command fails
+        usable = provider_name in PROVIDERS and bool(self.config.get_api_key(provider_name))
+        
+        speculation = {}
+        
+        def speculate(stderr: str):
+            # One speculative request per run, assuming the usual exit code of 1
+            if speculation:
                 return
+            if 'provider' not in state:
+                state['idle_stderr'] = stderr
+                return
+            if not (ERROR_PATTERN.search(stderr) or len(stderr) > SPECULATE_MIN_CHARS):
+                return
+            speculation['context'] = self._error_context(command_args, stderr, 1)
+            speculation['task'] = asyncio.create_task(
+                self.get_explanation_async(state['provider'], provider_name, speculation['context'])
+            )
+            background.append(speculation['task'])
+        
+        provider = None
+        try:
+            # Run the command; its output has already been streamed to the terminal
+            stderr, exit_code = await self.run_command(
+                command_args,
+                speculate if usable else None,
+                start_warm_up if usable else None
+            )
             
-            error_context = {
-                'command': ' '.join(command_args),
-                'stdout': stdout,
-                'stderr': stderr,
-                'exit_code': exit_code,
-            }
+            if exit_code == 0:
+                return
             
-            print(Fore.CYAN + "AI Explanation:")
-            explanation = provider.explain_error(error_context)
-            print(Fore.GREEN + explanation)
+            print()
+            
+            # Get AI explanation if error occurred
+            if stderr or exit_code != 0:
+                provider = state.get('provider') or self.get_provider(provider_name)
+                if not provider:
+                    return
+                
+                error_context = self._error_context(command_args, stderr, exit_code)
+                
+                if speculation.get('context') == error_context:
+                    explanation, cached = await speculation['task']
+                else:
+                    explanation, cached = await self.get_explanation_async(provider, provider_name, error_context)
+                heading = "AI Explanation (cached):" if cached else "AI Explanation:"
+                print(f"{CYAN}{heading}{RESET}")
+                print(f"{GREEN}{explanation}{RESET}")
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            provider = state.get('provider') or provider
+            if provider:
+                await provider.aclose()
 
 def main():
     explainer = ErrorExplainer()
@@ -270,6 +853,7 @@ def main():
     # Check if first argument is 'config'
     if len(sys.argv) > 1 and sys.argv[1] == 'config':
         # Handle config subcommand
+        import argparse
         parser = argparse.ArgumentParser(description='Configure xplc')
         parser.add_argument('config', help='Configuration mode')
         parser.add_argument('--set-key', nargs=2, metavar=('PROVIDER', 'KEY'), 
@@ -293,23 +877,57 @@ def main():
             print("API keys configured for:", ', '.join(config.get('api_keys', {}).keys()))
         else:
             print("Usage: xplc config [--set-key PROVIDER KEY] [--default PROVIDER] [--list]")
-    else:
-        # Handle normal command execution
-        parser = argparse.ArgumentParser(description='xplc - AI-powered CLI error explainer')
+    elif len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        # Explain failures recorded elsewhere, several per request
+        import argparse
+        parser = argparse.ArgumentParser(description='Explain a batch of failed commands')
+        parser.add_argument('batch', help='Batch mode')
+        parser.add_argument('--from-file', metavar='PATH',
+                          help='JSON lines file of {"command", "stderr", "exit_code"} entries')
+        parser.add_argument('--window-ms', type=int, default=500, metavar='MS',
+                          help='When reading stdin, how long to wait for more entries before sending a batch')
         parser.add_argument('--provider', '-p', help='AI provider (openai, claude, gemini)')
-        parser.add_argument('command', nargs='*', help='Command to run and explain')
         
         args = parser.parse_args()
+        explainer.batch(args.from_file, args.window_ms, args.provider)
+    else:
+        # Handle normal command execution. The grammar is just
+        # [--provider PROVIDER] [--] <command...>, so it is parsed by hand to
+        # keep argparse off the path every wrapped command takes.
+        argv = sys.argv[1:]
+        provider = None
+        if argv and argv[0] in ('-h', '--help'):
+            print_usage()
+            return
+        if argv and argv[0] in ('-p', '--provider'):
+            if len(argv) < 2:
+                print(f"xplc: {argv[0]} requires a PROVIDER argument", file=sys.stderr)
+                sys.exit(2)
+            provider, argv = argv[1], argv[2:]
+        elif argv and argv[0].startswith('--provider='):
+            provider, argv = argv[0].split('=', 1)[1], argv[1:]
+        if argv and argv[0] == '--':
+            argv = argv[1:]
+        elif argv and argv[0].startswith('-'):
+            # Most likely a mistyped xplc option; don't run it as a command
+            print(f"xplc: unrecognized option '{argv[0]}'", file=sys.stderr)
+            print("Use -- before commands that start with '-', e.g. xplc -- -cmd", file=sys.stderr)
+            sys.exit(2)
         
-        if args.command:
-            explainer.explain(args.command, args.provider)
+        if argv:
+            asyncio.run(explainer.explain(argv, provider))
         else:
-            print("Usage: xplc [--provider PROVIDER] <command>")
-            print("       xplc config [--set-key PROVIDER KEY] [--default PROVIDER] [--list]")
-            print("\nExamples:")
-            print("  xplc python script.py")
-            print("  xplc --provider gemini npm start") 
-            print("  xplc config --set-key gemini YOUR_API_KEY")
+            print_usage()
+
+def print_usage():
+    print("Usage: xplc [--provider PROVIDER] [--] <command>")
+    print("       xplc config [--set-key PROVIDER KEY] [--default PROVIDER] [--list]")
+    print("       xplc batch [--from-file FILE] [--window-ms MS] [--provider PROVIDER]")
+    print("\nUse -- before commands that start with '-' or are named 'config' or 'batch'.")
+    print("\nExamples:")
+    print("  xplc python script.py")
+    print("  xplc --provider gemini npm start") 
+    print("  xplc config --set-key gemini YOUR_API_KEY")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file